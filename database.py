@@ -5,28 +5,45 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+import redis.asyncio as redis
+from redis.exceptions import RedisError
 from datetime import datetime, timezone
+import logging
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Optional, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 _client = None
 db = None
+cache = None
 
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
+redis_url = os.getenv("REDIS_URL")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = AsyncIOMotorClient(
+        database_url,
+        minPoolSize=10,
+        maxPoolSize=50,
+        maxIdleTimeMS=60000,
+        serverSelectionTimeoutMS=3000,
+        waitQueueTimeoutMS=2000,
+    )
     db = _client[database_name]
 
+if redis_url:
+    cache = redis.from_url(redis_url)
+
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -37,19 +54,65 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     else:
         data_dict = data.copy()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    now = datetime.now(timezone.utc)
+    data_dict['created_at'] = now
+    data_dict['updated_at'] = now
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def create_documents(collection_name: str, items: List[Union[BaseModel, dict]]):
+    """Insert many documents in one unordered batch, each with timestamps"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for data in items:
+        data_dict = data.model_dump() if isinstance(data, BaseModel) else data.copy()
+        data_dict['created_at'] = now
+        data_dict['updated_at'] = now
+        docs.append(data_dict)
+
+    result = await db[collection_name].insert_many(docs, ordered=False)
+    return [str(_id) for _id in result.inserted_ids]
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None):
+    """Get documents from collection, optionally limited to the projected fields"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=None)
+
+# Cache helpers: Redis is an optimization, so an outage reads as a miss
+async def cache_get(key: str) -> Optional[bytes]:
+    """Get a cached value, or None if missing or Redis is unavailable"""
+    if cache is None:
+        return None
+    try:
+        return await cache.get(key)
+    except RedisError:
+        logger.warning("Redis GET %s failed; treating as a miss", key, exc_info=True)
+        return None
+
+async def cache_set(key: str, value, ttl: int):
+    """Set a cached value with a TTL in seconds; failures are logged and ignored"""
+    if cache is None:
+        return
+    try:
+        await cache.set(key, value, ex=ttl)
+    except RedisError:
+        logger.warning("Redis SET %s failed", key, exc_info=True)
+
+async def cache_delete(key: str):
+    """Drop a cached value; failures are logged and ignored"""
+    if cache is None:
+        return
+    try:
+        await cache.delete(key)
+    except RedisError:
+        logger.warning("Redis DEL %s failed", key, exc_info=True)
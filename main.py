@@ -1,17 +1,32 @@
 import os
+import re
+import sys
+import logging
+import time
+import hmac
+import base64
+import asyncio
 import hashlib
 import secrets
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
-from typing import List, Optional
+from typing import Any, Callable, List, Optional, TypeVar
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import ORJSONResponse
+from bson import ObjectId
+from pydantic import BaseModel, EmailStr, TypeAdapter, field_validator
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, PyMongoError, ServerSelectionTimeoutError
 
-from database import db, create_document, get_documents
+from database import db, cache_get, cache_set, cache_delete, create_document, create_documents, get_documents
+from passwords import password_hasher, hash_password, verify_password, init_hash_worker
 from schemas import AuthUser, BlogPost, ContactMessage
 
-app = FastAPI(title="SaaS Starter API")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="SaaS Starter API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,18 +36,199 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+async def create_email_index():
+    await db["authuser"].create_index("email", unique=True)
+    app.state.email_index_ready = True
+
+
+@app.on_event("startup")
+async def create_indexes():
+    # Also connects the pool before the first request. Failures are logged, not
+    # raised, so the app still starts and /test can report the database state.
+    if db is None:
+        return
+    try:
+        await create_email_index()
+    except ServerSelectionTimeoutError:
+        logger.exception("MongoDB unreachable at startup; skipping index creation")
+        return
+    except PyMongoError:
+        logger.exception("Could not create unique index on authuser.email")
+    try:
+        await db["blogpost"].create_index("slug", unique=True)
+    except PyMongoError:
+        logger.exception("Could not create unique index on blogpost.slug")
+
+
+@app.on_event("startup")
+async def start_hash_pool():
+    # Password hashing is CPU-bound; keep it off the event loop thread.
+    # Split the cores between the web workers so they don't oversubscribe. Set the
+    # worker count with WEB_CONCURRENCY (uvicorn's default for --workers), not --workers.
+    web_workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    # Workers come from a forkserver rather than fork(): by the time the pool
+    # starts them, Motor/PyMongo already have background threads running.
+    # The forkserver preloads passwords so each worker starts with argon2 imported.
+    mp_context = multiprocessing.get_context("forkserver")
+    mp_context.set_forkserver_preload(["passwords"])
+    app.state.hash_pool = ProcessPoolExecutor(
+        max_workers=max(1, (os.cpu_count() or 1) // web_workers),
+        mp_context=mp_context,
+        initializer=init_hash_worker,
+    )
+
+
+@app.on_event("shutdown")
+async def stop_hash_pool():
+    app.state.hash_pool.shutdown(wait=False, cancel_futures=True)
+
+
+CONTACT_BATCH_SIZE = 100
+CONTACT_QUEUE_SIZE = 1000
+CONTACT_RETRY_MAX_DELAY = 5
+CONTACT_FLUSH_TIMEOUT = 5
+
+
+async def store_contact_batch(batch: List[dict]) -> None:
+    # Messages carry their own _id, so retrying a batch that partly landed is idempotent.
+    # Never raises: the writer task has to outlive any single bad batch.
+    delay = 0.1
+    while True:
+        try:
+            await create_documents("contactmessage", batch)
+            return
+        except BulkWriteError as e:
+            # Unordered insert: everything except the listed write errors was stored.
+            # Duplicate _ids are messages an earlier attempt already stored.
+            rejected = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+            if rejected:
+                logger.error("MongoDB rejected %d of %d contact messages: %s", len(rejected), len(batch), rejected[0].get("errmsg"))
+            return
+        except ConnectionFailure:
+            # Transient (Mongo down, network or pool timeout): keep the batch and retry
+            logger.warning("Storing %d contact messages failed; retrying in %.1fs", len(batch), delay, exc_info=True)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, CONTACT_RETRY_MAX_DELAY)
+        except Exception:
+            # Permanent (e.g. DocumentTooLarge, auth OperationFailure): isolate the
+            # offending messages so the rest of the batch still gets stored
+            if len(batch) > 1:
+                logger.exception("Storing %d contact messages failed; retrying one at a time", len(batch))
+                for doc in batch:
+                    await store_contact_batch([doc])
+            else:
+                logger.exception("Dropping contact message %s that could not be stored", batch[0].get("_id"))
+            return
+
+
+async def write_contact_batches(queue: asyncio.Queue) -> None:
+    # Coalesce bursts of contact submissions into unordered bulk inserts
+    batch = []
+    try:
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty() and len(batch) < CONTACT_BATCH_SIZE:
+                batch.append(queue.get_nowait())
+            await store_contact_batch(batch)
+            for _ in batch:
+                queue.task_done()
+            batch = []
+            await asyncio.sleep(0.05)
+    except asyncio.CancelledError:
+        unsaved = len(batch) + queue.qsize()
+        if unsaved:
+            logger.error("Dropping %d unsaved contact messages", unsaved)
+        raise
+
+
+@app.on_event("startup")
+async def start_contact_writer():
+    app.state.contact_queue = asyncio.Queue(maxsize=CONTACT_QUEUE_SIZE)
+    app.state.contact_writer = asyncio.create_task(write_contact_batches(app.state.contact_queue))
+
+
+@app.on_event("shutdown")
+async def stop_contact_writer():
+    # Give queued messages a chance to reach Mongo before exiting
+    try:
+        await asyncio.wait_for(app.state.contact_queue.join(), timeout=CONTACT_FLUSH_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    app.state.contact_writer.cancel()
+    try:
+        await app.state.contact_writer
+    except asyncio.CancelledError:
+        pass
+
+
 # Utility functions for auth
 
-def hash_password(password: str, salt: Optional[str] = None):
-    if salt is None:
-        salt = secrets.token_hex(16)
-    pwd_hash = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), 200000)
-    return salt, pwd_hash.hex()
+T = TypeVar("T")
+
+
+async def run_in_hash_pool(func: Callable[..., T], *args: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(app.state.hash_pool, func, *args)
+
+
+SESSION_TTL = 3600
+SESSION_SECRET = os.getenv("SESSION_SECRET", "").encode()
+if not SESSION_SECRET:
+    # A per-process key only verifies tokens in the worker that issued them, and the
+    # worker count isn't visible from here (uvicorn --workers), so only allow it for
+    # the single-process dev server (uvicorn --reload)
+    if not any(arg.startswith("--reload") for arg in sys.argv):
+        raise RuntimeError("SESSION_SECRET must be set (only uvicorn --reload may run without it)")
+    logger.warning("SESSION_SECRET not set; using a random key, so sessions end on restart")
+    SESSION_SECRET = secrets.token_bytes(32)
+
+
+def create_session_token(user_id: str) -> str:
+    # Stateless token: base64("<user_id>.<issued_at>" + "." + HMAC-SHA256 signature)
+    payload = f"{user_id}.{int(time.time())}".encode()
+    sig = hmac.new(SESSION_SECRET, payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(payload + b"." + sig).decode()
+
+
+def verify_session_token(token: str) -> Optional[str]:
+    try:
+        raw = base64.urlsafe_b64decode(token)
+    except ValueError:
+        return None
+    payload, sep, sig = raw[:-33], raw[-33:-32], raw[-32:]
+    if sep != b"." or not hmac.compare_digest(sig, hmac.new(SESSION_SECRET, payload, hashlib.sha256).digest()):
+        return None
+    user_id, _, issued_at = payload.decode().rpartition(".")
+    if time.time() - int(issued_at) > SESSION_TTL:
+        return None
+    return user_id
+
+
+def current_user_id(authorization: Optional[str] = Header(None)) -> str:
+    scheme, _, token = (authorization or "").partition(" ")
+    user_id = verify_session_token(token) if scheme.lower() == "bearer" else None
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+    return user_id
+
+
+async def upgrade_password_hash(user_id: Any, password: str) -> None:
+    # Upgrade legacy PBKDF2 (or outdated argon2) hashes on successful login
+    await db["authuser"].update_one(
+        {"_id": user_id},
+        {"$set": {"password_hash": await run_in_hash_pool(hash_password, password)}, "$unset": {"salt": ""}},
+    )
+
+
+FAILED_LOGIN_TTL = 60
 
 
-def verify_password(password: str, salt: str, password_hash: str) -> bool:
-    _, computed = hash_password(password, salt)
-    return secrets.compare_digest(computed, password_hash)
+def failed_login_key(email: str, password_hash: str, password: str) -> str:
+    # Keyed on the stored hash too, so a password change invalidates the entry.
+    # HMAC with the server secret so a Redis dump can't be used to test guesses offline.
+    digest = hmac.new(SESSION_SECRET, f"{password_hash}:{password}".encode(), hashlib.sha256).hexdigest()
+    return f"badpw:{email}:{digest}"
 
 
 # Request/Response models
@@ -42,14 +238,37 @@ class RegisterRequest(BaseModel):
     email: EmailStr
     password: str
 
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+# "John Doe <jd@example.com>" form, which EmailStr also accepts
+PRETTY_EMAIL_RE = re.compile(r"[^<]*<(.+)>\s*")
+
 class LoginRequest(BaseModel):
-    email: EmailStr
+    # Full EmailStr validation only matters when an address is stored (register);
+    # login just looks it up, so a cheap shape check is enough
+    email: str
     password: str
 
+    @field_validator("email")
+    @classmethod
+    def check_email(cls, v: str) -> str:
+        pretty = PRETTY_EMAIL_RE.fullmatch(v)
+        if pretty:
+            v = pretty.group(1)
+        v = v.strip()
+        if not EMAIL_RE.fullmatch(v):
+            raise ValueError("value is not a valid email address")
+        # Match EmailStr's normalization of stored addresses (lowercase domain)
+        local, _, domain = v.rpartition("@")
+        return f"{local}@{domain.lower()}"
+
 class LoginResponse(BaseModel):
     token: str
     name: str
-    email: EmailStr
+    email: str
+
+class UserResponse(BaseModel):
+    name: str
+    email: str
 
 class BlogCreateRequest(BaseModel):
     title: str
@@ -72,7 +291,7 @@ def read_root():
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -87,7 +306,7 @@ def test_database():
             response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
             response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
             try:
-                collections = db.list_collection_names()
+                collections = await db.list_collection_names()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
                 response["connection_status"] = "Connected"
@@ -103,64 +322,92 @@ def test_database():
 # Auth Endpoints
 
 @app.post("/auth/register", response_model=LoginResponse)
-def register(payload: RegisterRequest):
-    # Check if user exists
-    existing = list(db["authuser"].find({"email": payload.email})) if db else []
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    salt, pwd_hash = hash_password(payload.password)
+async def register(payload: RegisterRequest):
+    if db is not None and not getattr(app.state, "email_index_ready", False):
+        # Uniqueness isn't enforced yet (Mongo was down at boot, or existing duplicates
+        # block the index): retry the index, and check explicitly until it exists
+        try:
+            await create_email_index()
+        except PyMongoError as e:
+            logger.warning("Unique index on authuser.email still missing: %s", e)
+            if await db["authuser"].find_one({"email": payload.email}, {"_id": 1}):
+                raise HTTPException(status_code=400, detail="Email already registered")
+    pwd_hash = await run_in_hash_pool(hash_password, payload.password)
+    now = datetime.now(timezone.utc)
     user = AuthUser(
         name=payload.name,
         email=payload.email,
         password_hash=pwd_hash,
-        salt=salt,
-        created_at=datetime.now(timezone.utc),
-        updated_at=datetime.now(timezone.utc),
-    )
-    _id = create_document("authuser", user)
-    token = secrets.token_urlsafe(24)
-    # Store session token (simple): upsert into a collection
-    db["session"].update_one(
-        {"user_id": _id},
-        {"$set": {"user_id": _id, "token": token, "created_at": datetime.now(timezone.utc)}},
-        upsert=True,
+        created_at=now,
+        updated_at=now,
     )
+    # Once the unique index exists it rejects existing users in the same round trip
+    try:
+        _id = await create_document("authuser", user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    token = create_session_token(_id)
     return LoginResponse(token=token, name=user.name, email=user.email)
 
 
+LOGIN_PROJECTION = {"name": 1, "email": 1, "salt": 1, "password_hash": 1}
+
+
 @app.post("/auth/login", response_model=LoginResponse)
-def login(payload: LoginRequest):
-    user = db["authuser"].find_one({"email": payload.email}) if db else None
+async def login(payload: LoginRequest):
+    user = await db["authuser"].find_one({"email": payload.email}, LOGIN_PROJECTION) if db is not None else None
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    if not verify_password(payload.password, user.get("salt"), user.get("password_hash")):
+    # Skip the hash for a password that already failed recently
+    bad_key = failed_login_key(payload.email, user.get("password_hash"), payload.password)
+    if await cache_get(bad_key):
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    token = secrets.token_urlsafe(24)
-    db["session"].update_one(
-        {"user_id": str(user.get("_id"))},
-        {"$set": {"user_id": str(user.get("_id")), "token": token, "created_at": datetime.now(timezone.utc)}},
-        upsert=True,
-    )
+    if not await run_in_hash_pool(verify_password, payload.password, user.get("password_hash"), user.get("salt")):
+        await cache_set(bad_key, 1, FAILED_LOGIN_TTL)
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if user.get("salt") or password_hasher.check_needs_rehash(user.get("password_hash")):
+        await upgrade_password_hash(user.get("_id"), payload.password)
+    token = create_session_token(str(user.get("_id")))
     return LoginResponse(token=token, name=user.get("name"), email=user.get("email"))
 
 
+@app.get("/auth/me", response_model=UserResponse)
+async def me(user_id: str = Depends(current_user_id)):
+    user = await db["authuser"].find_one({"_id": ObjectId(user_id)}, {"name": 1, "email": 1}) if db is not None else None
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return UserResponse(name=user.get("name"), email=user.get("email"))
+
+
 # Blog Endpoints
 
+blog_list_adapter = TypeAdapter(List[BlogPost])
+BLOG_PROJECTION = {"_id": 0, **{field: 1 for field in BlogPost.model_fields}}
+BLOG_CACHE_KEY = "blog:list"
+BLOG_CACHE_TTL = 60
+
+
 @app.get("/blog", response_model=List[BlogPost])
-def list_blogs():
-    docs = get_documents("blogpost", {}, limit=20)
-    # Convert ObjectId to string-safe fields
-    out = []
+async def list_blogs():
+    cached = await cache_get(BLOG_CACHE_KEY)
+    if cached:
+        return Response(content=cached, media_type="application/json")
+    docs = await get_documents("blogpost", {}, limit=20, projection=BLOG_PROJECTION)
+    now = datetime.now(timezone.utc)
     for d in docs:
-        d.pop("_id", None)
         if d.get("published") and not d.get("published_at"):
-            d["published_at"] = datetime.now(timezone.utc)
-        out.append(BlogPost(**d))
-    return out
+            d["published_at"] = now
+    # Validate the whole page in one call instead of one BlogPost(**d) per doc
+    posts = blog_list_adapter.validate_python(docs)
+    # Already validated; serialize straight to JSON bytes in pydantic-core and skip
+    # response_model re-serialization (same wire format as the response_model path)
+    body = blog_list_adapter.dump_json(posts)
+    await cache_set(BLOG_CACHE_KEY, body, BLOG_CACHE_TTL)
+    return Response(content=body, media_type="application/json")
 
 
 @app.post("/blog", response_model=BlogPost)
-def create_blog(payload: BlogCreateRequest):
+async def create_blog(payload: BlogCreateRequest):
     data = BlogPost(
         title=payload.title,
         slug=payload.slug,
@@ -172,14 +419,20 @@ def create_blog(payload: BlogCreateRequest):
         published_at=datetime.now(timezone.utc) if payload.published else None,
         author="admin",
     )
-    create_document("blogpost", data)
+    try:
+        await create_document("blogpost", data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Slug already exists")
+    # A listing that read Mongo before this insert can still re-cache the old
+    # page afterwards; it then lives until BLOG_CACHE_TTL expires
+    await cache_delete(BLOG_CACHE_KEY)
     return data
 
 
 # Contact Endpoints
 
 @app.post("/contact")
-def contact_submit(payload: ContactRequest):
+async def contact_submit(payload: ContactRequest):
     msg = ContactMessage(
         name=payload.name,
         email=payload.email,
@@ -187,11 +440,31 @@ def contact_submit(payload: ContactRequest):
         status="new",
         submitted_at=datetime.now(timezone.utc),
     )
-    create_document("contactmessage", msg)
+    if db is None:
+        # Nothing will ever drain the queue; fail the request as before
+        await create_document("contactmessage", msg)
+        return {"ok": True}
+    doc = msg.model_dump()
+    doc["_id"] = ObjectId()
+    try:
+        app.state.contact_queue.put_nowait(doc)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Too many pending messages, please retry shortly")
     return {"ok": True}
 
 
 if __name__ == "__main__":
+    # Prefer the uvicorn CLI (see start_server.sh): when main.py is __main__,
+    # multiprocessing re-imports it in every hash pool worker.
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Workers are separate processes that import main, so each gets its own Mongo/Redis clients
+    os.environ.setdefault("WEB_CONCURRENCY", str(os.cpu_count() or 1))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ["WEB_CONCURRENCY"]),
+    )
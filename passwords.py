@@ -0,0 +1,40 @@
+"""
+Password Hashing Helpers
+
+CPU-bound hashing functions run inside the hash process pool.
+Kept separate from main.py so pool workers only need argon2/hashlib.
+Multiprocessing still re-imports the parent's __main__ script in each
+worker, so this only holds when uvicorn is launched through its CLI
+(`uvicorn main:app`); under `python main.py` every worker also imports
+main.py and builds the app and its database clients.
+"""
+
+import hashlib
+import secrets
+from typing import Optional
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+
+password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+
+
+def init_hash_worker():
+    """Pool initializer; unpickling it makes each worker import this module (argon2, hashlib) at start-up"""
+
+
+def hash_password(password: str) -> str:
+    # argon2 encodes the salt and parameters inside the hash string
+    return password_hasher.hash(password)
+
+
+def verify_password(password: str, password_hash: str, salt: Optional[str] = None) -> bool:
+    if salt:
+        # Legacy PBKDF2 record created before the switch to argon2.
+        # hashlib.pbkdf2_hmac already runs OpenSSL's PKCS5_PBKDF2_HMAC in C.
+        computed = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), 200000)
+        return secrets.compare_digest(computed, bytes.fromhex(password_hash))
+    try:
+        return password_hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
@@ -11,7 +11,7 @@ Model name is converted to lowercase for the collection name:
 - BlogPost -> "blogpost" collection
 """
 
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr
 from typing import Optional, List
 from datetime import datetime
 
@@ -45,12 +45,13 @@ class AuthUser(BaseModel):
     """
     Auth users collection schema
     Collection name: "authuser"
-    Stores password as a salted hash
+    Stores password as an argon2 hash (salt is embedded in the hash)
     """
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     name: str = Field(..., description="Full name")
     email: EmailStr
     password_hash: str
-    salt: str
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
@@ -59,6 +60,8 @@ class BlogPost(BaseModel):
     Blog posts collection schema
     Collection name: "blogpost"
     """
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     title: str
     slug: str
     excerpt: Optional[str] = None
@@ -74,6 +77,8 @@ class ContactMessage(BaseModel):
     Contact messages collection schema
     Collection name: "contactmessage"
     """
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     name: str
     email: EmailStr
     message: str
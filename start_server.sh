@@ -15,5 +15,9 @@ mkdir -p logs
 echo "Installing dependencies..."
 pip install -r requirements.txt
 echo "Starting FastAPI server..."
-nohup uvicorn main:app --host 0.0.0.0 --port 8000 --reload > logs/server.log 2>&1 
+# Dev server: one process with --reload, so SESSION_SECRET may be left unset.
+# In production set SESSION_SECRET and choose the worker count with WEB_CONCURRENCY
+# (uvicorn's default for --workers, also used to size the hash pool), e.g.
+#   SESSION_SECRET=... WEB_CONCURRENCY=4 uvicorn main:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools
+nohup uvicorn main:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools --reload > logs/server.log 2>&1 
 echo "Server started in background"
@@ -0,0 +1,251 @@
+import asyncio
+import base64
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from pymongo.errors import AutoReconnect, BulkWriteError, DocumentTooLarge, OperationFailure
+
+os.environ.setdefault("SESSION_SECRET", "test-secret")
+
+import main
+
+
+# Login email normalization
+
+@pytest.mark.parametrize("raw", [
+    "a@b.com",
+    " a@b.com ",
+    "A.B@Example.COM",
+    "John <jd@x.com>",
+    "  John Doe  <jd@X.com> ",
+    "<a@b.com>",
+])
+def test_login_email_matches_emailstr(raw):
+    # Login must look up the same address register stored via EmailStr
+    expected = TypeAdapter(EmailStr).validate_python(raw)
+    assert main.LoginRequest(email=raw, password="pw").email == expected
+
+
+def test_login_email_strips_trailing_newline():
+    assert main.LoginRequest(email="a@b.com\n", password="pw").email == "a@b.com"
+
+
+@pytest.mark.parametrize("raw", ["a@b", "a b@c.com", "a@@b.com", "a@b.com\nx", ""])
+def test_login_email_rejects_invalid(raw):
+    with pytest.raises(ValidationError):
+        main.LoginRequest(email=raw, password="pw")
+
+
+# Session tokens
+
+def test_session_token_round_trip():
+    token = main.create_session_token("65f0c0ffee")
+    assert main.verify_session_token(token) == "65f0c0ffee"
+
+
+def test_session_token_rejects_tampering():
+    raw = bytearray(base64.urlsafe_b64decode(main.create_session_token("65f0c0ffee")))
+    raw[0] ^= 1  # flip a bit in the user id
+    assert main.verify_session_token(base64.urlsafe_b64encode(bytes(raw)).decode()) is None
+
+
+def test_session_token_rejects_other_secret(monkeypatch):
+    token = main.create_session_token("65f0c0ffee")
+    monkeypatch.setattr(main, "SESSION_SECRET", b"another secret")
+    assert main.verify_session_token(token) is None
+
+
+@pytest.mark.parametrize("token", ["", "???", "not-a-token", base64.urlsafe_b64encode(b"x" * 40).decode()])
+def test_session_token_rejects_malformed(token):
+    assert main.verify_session_token(token) is None
+
+
+def test_session_token_expires(monkeypatch):
+    token = main.create_session_token("65f0c0ffee")
+    now = time.time()
+    monkeypatch.setattr(main.time, "time", lambda: now + main.SESSION_TTL - 5)
+    assert main.verify_session_token(token) == "65f0c0ffee"
+    monkeypatch.setattr(main.time, "time", lambda: now + main.SESSION_TTL + 5)
+    assert main.verify_session_token(token) is None
+
+
+def test_current_user_id_requires_bearer_token():
+    token = main.create_session_token("65f0c0ffee")
+    assert main.current_user_id(f"Bearer {token}") == "65f0c0ffee"
+    for header in [None, token, f"Basic {token}", "Bearer junk"]:
+        with pytest.raises(HTTPException) as exc:
+            main.current_user_id(header)
+        assert exc.value.status_code == 401
+
+
+# Registration without a confirmed unique email index
+
+class FakeUsers:
+    def __init__(self, index_error=None, existing=None):
+        self.index_error = index_error
+        self.existing = existing
+
+    async def create_index(self, *args, **kwargs):
+        if self.index_error:
+            raise self.index_error
+
+    async def find_one(self, *args, **kwargs):
+        return self.existing
+
+
+@pytest.fixture
+def users(monkeypatch):
+    def install(**kwargs):
+        fake = FakeUsers(**kwargs)
+        monkeypatch.setattr(main, "db", {"authuser": fake})
+        monkeypatch.setattr(main.app.state, "email_index_ready", False, raising=False)
+        return fake
+    return install
+
+
+def test_register_checks_duplicates_while_index_missing(users):
+    users(index_error=OperationFailure("E11000 duplicate key"), existing={"_id": 1})
+    payload = main.RegisterRequest(name="n", email="a@b.com", password="pw")
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.register(payload))
+    assert exc.value.status_code == 400
+    assert main.app.state.email_index_ready is False
+
+
+def test_register_retries_missing_index(users, monkeypatch):
+    users()
+
+    async def stop_after_index(*args):
+        raise RuntimeError("stop")
+
+    monkeypatch.setattr(main, "run_in_hash_pool", stop_after_index)
+    payload = main.RegisterRequest(name="n", email="a@b.com", password="pw")
+    with pytest.raises(RuntimeError):
+        asyncio.run(main.register(payload))
+    assert main.app.state.email_index_ready is True
+
+
+# Contact batching
+
+class FakeContactStore:
+    """Stands in for create_documents; fails the first `failures` calls with `error`"""
+
+    def __init__(self, failures=0, error=None):
+        self.failures = failures
+        self.error = error or AutoReconnect("mongo down")
+        self.calls = 0
+        self.stored = []
+
+    async def __call__(self, collection_name, items):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        self.stored.extend(items)
+
+
+@pytest.fixture
+def contact_store(monkeypatch):
+    def install(**kwargs):
+        store = FakeContactStore(**kwargs)
+        monkeypatch.setattr(main, "create_documents", store)
+        return store
+    monkeypatch.setattr(main, "CONTACT_RETRY_MAX_DELAY", 0.1)
+    # start_contact_writer replaces these; registering them restores app.state afterwards
+    monkeypatch.setattr(main.app.state, "contact_queue", None, raising=False)
+    monkeypatch.setattr(main.app.state, "contact_writer", None, raising=False)
+    return install
+
+
+async def run_writer(messages):
+    await main.start_contact_writer()
+    for message in messages:
+        main.app.state.contact_queue.put_nowait(message)
+    await main.stop_contact_writer()
+
+
+def test_contact_batch_retried_after_failed_insert(contact_store):
+    store = contact_store(failures=2)
+    messages = [{"_id": i} for i in range(5)]
+    asyncio.run(run_writer(messages))
+    assert store.calls == 3
+    assert store.stored == messages
+
+
+def test_contact_batch_partial_bulk_write_error_not_retried(contact_store):
+    error = BulkWriteError({"writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate key"}], "nInserted": 2})
+    store = contact_store(failures=1, error=error)
+    asyncio.run(run_writer([{"_id": i} for i in range(3)]))
+    assert store.calls == 1
+
+
+def test_contact_batches_flushed_on_shutdown(contact_store):
+    store = contact_store()
+    messages = [{"_id": i} for i in range(main.CONTACT_BATCH_SIZE + 50)]
+    asyncio.run(run_writer(messages))
+    assert store.calls == 2
+    assert store.stored == messages
+
+
+def test_contact_unsaved_messages_logged_when_flush_times_out(contact_store, monkeypatch, caplog):
+    contact_store(failures=10**6)
+    monkeypatch.setattr(main, "CONTACT_FLUSH_TIMEOUT", 0.2)
+    asyncio.run(run_writer([{"_id": i} for i in range(3)]))
+    assert "Dropping 3 unsaved contact messages" in caplog.text
+
+
+class OversizedContactStore:
+    """Rejects any batch containing an oversized message, like insert_many does"""
+
+    def __init__(self):
+        self.calls = 0
+        self.stored = []
+
+    async def __call__(self, collection_name, items):
+        self.calls += 1
+        if any(item.get("big") for item in items):
+            raise DocumentTooLarge("BSON document too large")
+        self.stored.extend(items)
+
+
+def test_contact_writer_survives_non_mongo_error(contact_store, monkeypatch):
+    store = OversizedContactStore()
+    monkeypatch.setattr(main, "create_documents", store)
+
+    async def scenario():
+        await main.start_contact_writer()
+        queue = main.app.state.contact_queue
+        for message in [{"_id": 0}, {"_id": 1, "big": True}, {"_id": 2}]:
+            queue.put_nowait(message)
+        await asyncio.wait_for(queue.join(), timeout=2)
+        queue.put_nowait({"_id": 3})
+        await main.stop_contact_writer()
+        return main.app.state.contact_writer
+
+    writer = asyncio.run(scenario())
+    assert [m["_id"] for m in store.stored] == [0, 2, 3]
+    assert writer.cancelled()
+
+
+def test_contact_permanent_mongo_error_not_retried_forever(contact_store):
+    store = contact_store(failures=10**6, error=OperationFailure("not authorized"))
+    asyncio.run(run_writer([{"_id": i} for i in range(3)]))
+    # One batch attempt, then one attempt per message
+    assert store.calls == 4
+    assert store.stored == []
+
+
+def test_contact_queue_full_returns_503(monkeypatch):
+    monkeypatch.setattr(main, "db", object())
+    payload = main.ContactRequest(name="n", email="a@b.com", message="hi")
+
+    async def submit():
+        monkeypatch.setattr(main.app.state, "contact_queue", asyncio.Queue(maxsize=1), raising=False)
+        await main.contact_submit(payload)
+        with pytest.raises(HTTPException) as exc:
+            await main.contact_submit(payload)
+        return exc.value.status_code
+
+    assert asyncio.run(submit()) == 503